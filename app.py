@@ -1,8 +1,8 @@
+import atexit
 import streamlit as st
 import pandas as pd
 from io import StringIO
 import sqlite3
-import cohere
 import matplotlib.pyplot as plt
 
 # ---------------- BACKEND & AUTH ----------------
@@ -11,6 +11,7 @@ from backend import (
     update_student, delete_student, fetch_students, all_rows
 )
 from auth import create_user_table, signup_user, login_user
+from llm_gateway import LLMGateway, BackgroundGateway, cohere_chat
 
 # ================= INITIAL SETUP =================
 create_db()
@@ -19,37 +20,16 @@ st.set_page_config(page_title="Student DBMS", page_icon="🎓", layout="wide")
 
 # ---------------- COHERE AI ----------------
 COHERE_API_KEY = "YOUR_API_KEY"
-co = cohere.Client(COHERE_API_KEY)
 
-def generate_sql(user_query: str) -> str:
-    prompt = f"""
-    You are an expert SQL assistant.
-    Convert the following natural language request into a valid **SQLite SELECT query only**
-    for the 'students' table.
-    ✅ Rules:
-    - Use only this schema: 
-      (student_id, roll_no, name, age, gender, category, address, course, current_year, 
-       semester, type, room_no, hostel_building, block, bus_no, route, attendance).
-    - Always start with: SELECT ... FROM students
-    - Do NOT generate INSERT, UPDATE, DELETE, CREATE, or DROP queries.
-    - Do NOT include explanations, comments, or markdown.
-    - Return ONLY the SQL query (one line or multi-line).
-    - Always match text values case-insensitively using `COLLATE NOCASE`.
-    - If the query is vague, assume the user wants *all columns*.
-    - If no condition is mentioned, return a general `SELECT * FROM students;`.
-    Request: {user_query}
-    """
-    response = co.chat(
-        message=prompt,
-        model="command-r",
-        temperature=0
-    )
-    sql_query = response.text.strip()
-    if sql_query.startswith("```"):
-        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-    if not sql_query.lower().startswith("select"):
-        sql_query = "SELECT * FROM students;"
-    return sql_query
+@st.cache_resource
+def get_llm_gateway() -> BackgroundGateway:
+    # One gateway per server process: all sessions share coalescing + concurrency cap.
+    gateway = BackgroundGateway(LLMGateway(cohere_chat(COHERE_API_KEY)))
+    atexit.register(gateway.close)
+    return gateway
+
+def generate_sql_many(user_queries):
+    return get_llm_gateway().generate_sql_many(user_queries)
 
 # ---------------- SESSION ----------------
 if "logged_in" not in st.session_state: st.session_state.logged_in = False
@@ -330,25 +310,32 @@ else:
     # -------------- AI DB ASSISTANT --------------
     elif choice == "🤖 AI DB Assistant":
         st.subheader("🤖 AI Database Assistant (Cohere)")
-        user_query = st.text_input("Enter your query (e.g., Show all hostellers in 2nd year):")
-        if st.button("Run Query", type="primary", key="ai_query_btn") and user_query:
-            sql_query = generate_sql(user_query).strip()
-            sql_query = sql_query.split(";")[0].strip()
-            if not sql_query.lower().startswith("select"):
-                st.error(f"❌ Only SELECT queries are allowed. (Got: {sql_query})")
-            else:
-                st.write("📄 Generated SQL:", sql_query)
-                conn = sqlite3.connect("students.db")
-                try:
-                    df = pd.read_sql_query(sql_query, conn)
-                    if not df.empty:
-                        st.dataframe(df, use_container_width=True)
-                    else:
-                        st.info("No results found.")
-                except Exception as e:
-                    st.error(f"SQL Error: {e}")
-                finally:
-                    conn.close()
+        user_input = st.text_area("Enter your queries, one per line (e.g., Show all hostellers in 2nd year):")
+        user_queries = [q.strip() for q in user_input.splitlines() if q.strip()]
+        if st.button("Run Query", type="primary", key="ai_query_btn") and user_queries:
+            with st.spinner(f"Generating SQL for {len(user_queries)} quer{'y' if len(user_queries) == 1 else 'ies'}..."):
+                results = generate_sql_many(user_queries)
+            for user_query, sql_query, err in results:
+                with st.expander(f"💬 {user_query}", expanded=True):
+                    if err:
+                        st.error(f"AI Error: {err}")
+                        continue
+                    sql_query = sql_query.split(";")[0].strip()
+                    if not sql_query.lower().startswith("select"):
+                        st.error(f"❌ Only SELECT queries are allowed. (Got: {sql_query})")
+                        continue
+                    st.write("📄 Generated SQL:", sql_query)
+                    conn = sqlite3.connect("students.db")
+                    try:
+                        df = pd.read_sql_query(sql_query, conn)
+                        if not df.empty:
+                            st.dataframe(df, use_container_width=True)
+                        else:
+                            st.info("No results found.")
+                    except Exception as e:
+                        st.error(f"SQL Error: {e}")
+                    finally:
+                        conn.close()
 
     # -------------- RISK PREDICTION --------------
     elif choice == "📊 Risk Prediction":
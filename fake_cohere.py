@@ -0,0 +1,151 @@
+"""
+Local fake Cohere server for trying out llm_gateway without an API key.
+
+Serves POST /v1/chat with a canned SELECT after a configurable delay, and can
+inject failures to exercise timeouts and retries.
+
+Benchmark (sequential vs gateway):
+    python fake_cohere.py --latency 0.3 --questions 20 --distinct 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Optional, Set
+
+from llm_gateway import LLMGateway, build_sql_prompt, cohere_chat
+
+CANNED_SQL = "SELECT * FROM students WHERE type = 'Hosteller' COLLATE NOCASE;"
+
+
+class FakeCohereServer:
+    """Minimal HTTP/1.1 server that answers the Cohere chat endpoint."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                 fail_rate: float = 0.0, reply: str = CANNED_SQL):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.reply = reply
+        self.calls = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeCohereServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Drop keep-alive client connections, or wait_closed() blocks on 3.12+.
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeCohereServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    # ---------------- HTTP ----------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self._respond(method, path.split("?")[0], body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, method: str, path: str, body: bytes):
+        if method != "POST" or path != "/v1/chat":
+            return "404 Not Found", {"message": f"no route for {method} {path}"}
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return "503 Service Unavailable", {"message": "injected failure"}
+        return "200 OK", {
+            "response_id": str(uuid.uuid4()),
+            "generation_id": str(uuid.uuid4()),
+            "text": self.reply,
+            "finish_reason": "COMPLETE",
+            "chat_history": [],
+        }
+
+
+# ============================= BENCHMARK =============================
+async def benchmark(latency: float, n_questions: int, n_distinct: int,
+                    concurrency: int, fail_rate: float) -> None:
+    questions = [f"Show all hostellers in year {i % n_distinct + 1}" for i in range(n_questions)]
+
+    async with FakeCohereServer(latency=latency, fail_rate=fail_rate) as server:
+        chat = cohere_chat("fake-key", base_url=server.base_url)
+        gateway = LLMGateway(chat, max_concurrency=concurrency, backoff_base=0.05)
+        try:
+            start = time.perf_counter()
+            for q in questions:
+                try:
+                    await chat(build_sql_prompt(q))   # same payload the gateway sends
+                except Exception:
+                    pass  # baseline has no retries; injected failures just count as done
+            sequential = time.perf_counter() - start
+            sequential_calls = server.calls
+
+            server.calls = 0
+            start = time.perf_counter()
+            results = await gateway.generate_sql_many(questions)
+            gated = time.perf_counter() - start
+        finally:
+            await gateway.aclose()   # close keep-alive connections before the server stops
+
+    errors = sum(1 for _, _, err in results if err)
+    print(f"questions={n_questions} distinct={n_distinct} latency={latency}s concurrency={concurrency}")
+    print(f"sequential: {sequential:.2f}s  upstream calls={sequential_calls}")
+    print(f"gateway:    {gated:.2f}s  upstream calls={server.calls}  errors={errors}  stats={gateway.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Cohere server latency benchmark")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.latency, args.questions, args.distinct,
+                          args.concurrency, args.fail_rate))
@@ -0,0 +1,230 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+# ============================= CONFIG =============================
+COHERE_MODEL = "command-r"
+MAX_CONCURRENCY = 4        # upstream calls allowed in flight at once
+CALL_TIMEOUT = 20.0        # seconds per upstream attempt
+MAX_RETRIES = 2            # extra attempts after the first one
+BACKOFF_BASE = 0.5         # seconds, doubled on every retry
+
+ChatFn = Callable[[str], Awaitable[str]]
+
+SQL_PROMPT = """
+    You are an expert SQL assistant.
+    Convert the following natural language request into a valid **SQLite SELECT query only**
+    for the 'students' table.
+    ✅ Rules:
+    - Use only this schema:
+      (student_id, roll_no, name, age, gender, category, address, course, current_year,
+       semester, type, room_no, hostel_building, block, bus_no, route, attendance).
+    - Always start with: SELECT ... FROM students
+    - Do NOT generate INSERT, UPDATE, DELETE, CREATE, or DROP queries.
+    - Do NOT include explanations, comments, or markdown.
+    - Return ONLY the SQL query (one line or multi-line).
+    - Always match text values case-insensitively using `COLLATE NOCASE`.
+    - If the query is vague, assume the user wants *all columns*.
+    - If no condition is mentioned, return a general `SELECT * FROM students;`.
+    Request: {question}
+    """
+
+
+# ============================= SQL HELPERS =============================
+def build_sql_prompt(question: str) -> str:
+    return SQL_PROMPT.format(question=question)
+
+
+def clean_sql(text: str) -> str:
+    """Strip markdown fences and fall back to a safe SELECT."""
+    sql_query = text.strip()
+    if sql_query.startswith("```"):
+        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+    if not sql_query.lower().startswith("select"):
+        sql_query = "SELECT * FROM students;"
+    return sql_query
+
+
+def normalize_question(question: str) -> str:
+    """Coalescing key: same words, ignoring case and extra whitespace."""
+    return " ".join(question.split()).casefold()
+
+
+# ============================= RETRY POLICY =============================
+def is_transient(exc: BaseException) -> bool:
+    """Timeouts, dropped connections and Cohere 429/5xx are worth retrying; nothing else is."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    try:
+        import httpx   # cohere's HTTP layer; connect/read failures surface as TransportError
+    except ImportError:
+        return False
+    return isinstance(exc, httpx.TransportError)
+
+
+# ============================= COHERE TRANSPORT =============================
+class CohereChat:
+    """
+    Async chat callable backed by cohere.AsyncClient.
+    The SDK's own retries and the HTTP client's timeout are disabled so the
+    gateway alone decides timeout and retry. Pass base_url to point it at a
+    local fake server (see fake_cohere.py).
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 model: str = COHERE_MODEL):
+        import cohere
+        import httpx
+
+        self.model = model
+        # No httpx timeout: LLMGateway's wait_for is the only per-attempt limit.
+        self._http = httpx.AsyncClient(timeout=None)
+        kwargs = {"base_url": base_url} if base_url else {}
+        self._client = cohere.AsyncClient(api_key, httpx_client=self._http, **kwargs)
+
+    async def __call__(self, prompt: str) -> str:
+        response = await self._client.chat(
+            message=prompt, model=self.model, temperature=0,
+            request_options={"max_retries": 0},
+        )
+        return response.text
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+def cohere_chat(api_key: str, base_url: Optional[str] = None,
+                model: str = COHERE_MODEL) -> CohereChat:
+    return CohereChat(api_key, base_url=base_url, model=model)
+
+
+# ============================= GATEWAY =============================
+class LLMGateway:
+    """
+    Async front door for LLM calls.
+      - identical questions already in flight share one upstream call
+      - at most `max_concurrency` upstream calls run at once
+      - each attempt is bounded by `timeout`, transient failures retried with backoff
+    All work runs on one event loop, so the in-flight table needs no lock.
+    """
+
+    def __init__(self, chat_fn: ChatFn, max_concurrency: int = MAX_CONCURRENCY,
+                 timeout: float = CALL_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE,
+                 should_retry: Callable[[BaseException], bool] = is_transient):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.chat_fn = chat_fn
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.should_retry = should_retry
+        self.stats = {"requests": 0, "coalesced": 0, "upstream_calls": 0, "retries": 0}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, "asyncio.Future[str]"] = {}
+
+    # ---------------- Upstream ----------------
+    async def _call_upstream(self, prompt: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    self.stats["upstream_calls"] += 1
+                    return await asyncio.wait_for(self.chat_fn(prompt), self.timeout)
+            except Exception as exc:
+                if attempt >= self.max_retries or not self.should_retry(exc):
+                    raise
+                self.stats["retries"] += 1
+                # Sleep outside the semaphore so a backing-off call frees its slot.
+                await asyncio.sleep(self.backoff_base * (2 ** attempt))
+                attempt += 1
+
+    # ---------------- Public API ----------------
+    async def generate(self, question: str) -> str:
+        """Return the raw model text for `question`, sharing identical in-flight calls."""
+        self.stats["requests"] += 1
+        key = normalize_question(question)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_upstream(build_sql_prompt(question)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one caller giving up does not cancel the call for everyone else.
+        return await asyncio.shield(task)
+
+    async def generate_sql(self, question: str) -> str:
+        return clean_sql(await self.generate(question))
+
+    async def generate_sql_many(self, questions: Sequence[str]) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Run a batch of questions in parallel (duplicates are coalesced).
+        Returns (question, sql, error) per question, in input order.
+        """
+        results = await asyncio.gather(
+            *(self.generate_sql(q) for q in questions), return_exceptions=True
+        )
+        out: List[Tuple[str, Optional[str], Optional[str]]] = []
+        for question, result in zip(questions, results):
+            if isinstance(result, BaseException):
+                msg = str(result) or type(result).__name__
+                out.append((question, None, msg))
+            else:
+                out.append((question, result, None))
+        return out
+
+    async def aclose(self) -> None:
+        """Close the underlying chat client, if it holds any connections."""
+        aclose = getattr(self.chat_fn, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+# ============================= SYNC BRIDGE =============================
+class BackgroundGateway:
+    """
+    Runs an LLMGateway on a private event loop thread so synchronous callers
+    (Streamlit script runs, one thread per session) share coalescing and the
+    concurrency cap across the whole process.
+    """
+
+    def __init__(self, gateway: LLMGateway):
+        self.gateway = gateway
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def _run(self, coro, timeout: Optional[float]):
+        fut = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()   # otherwise the coroutine keeps running on the loop
+            raise
+
+    def generate_sql(self, question: str, timeout: Optional[float] = None) -> str:
+        return self._run(self.gateway.generate_sql(question), timeout)
+
+    def generate_sql_many(self, questions: Sequence[str],
+                          timeout: Optional[float] = None) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        return self._run(self.gateway.generate_sql_many(questions), timeout)
+
+    def close(self) -> None:
+        """Close the chat client, then stop the loop thread. Safe to call twice."""
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self.gateway.aclose(), timeout=None)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
@@ -0,0 +1,297 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import llm_gateway
+from fake_cohere import CANNED_SQL, FakeCohereServer
+from llm_gateway import BackgroundGateway, LLMGateway, clean_sql, cohere_chat, is_transient
+
+
+# ============================= HELPERS =============================
+class StatusError(Exception):
+    """Mimics cohere's ApiError, which carries the HTTP status."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeChat:
+    """Async chat_fn that records calls and can fail or stall on demand."""
+
+    def __init__(self, delay: float = 0.05, reply: str = "SELECT * FROM students;", errors=()):
+        self.delay = delay
+        self.reply = reply
+        self.errors = list(errors)   # raised one per call, in order, before replying
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.closed = False
+
+    async def __call__(self, prompt: str) -> str:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return self.reply
+        finally:
+            self.active -= 1
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# ============================= SQL HELPERS =============================
+def test_clean_sql_strips_fences_and_rejects_non_select():
+    assert clean_sql("```sql\nSELECT name FROM students\n```") == "SELECT name FROM students"
+    assert clean_sql("DELETE FROM students") == "SELECT * FROM students;"
+
+
+# ============================= COALESCING / BATCHING =============================
+def test_duplicate_questions_share_one_upstream_call():
+    chat = FakeChat()
+    gateway = LLMGateway(chat)
+    questions = ["Show hostellers", "show   HOSTELLERS", "year 2", "Year 2", "semester 4"]
+
+    results = run(gateway.generate_sql_many(questions))
+
+    assert chat.calls == 3
+    assert gateway.stats["requests"] == 5
+    assert gateway.stats["coalesced"] == 2
+    assert gateway.stats["upstream_calls"] == 3
+    assert all(err is None for _, _, err in results)
+
+
+def test_generate_sql_many_keeps_input_order():
+    replies = {"a": 0.15, "b": 0.01, "c": 0.08}
+
+    async def chat(prompt):
+        question = prompt.split("Request:")[1].strip()
+        await asyncio.sleep(replies[question])
+        return f"SELECT '{question}' FROM students"
+
+    results = run(LLMGateway(chat).generate_sql_many(["a", "b", "c"]))
+
+    assert [(q, sql) for q, sql, _ in results] == [
+        ("a", "SELECT 'a' FROM students"),
+        ("b", "SELECT 'b' FROM students"),
+        ("c", "SELECT 'c' FROM students"),
+    ]
+
+
+def test_completed_calls_are_not_coalesced_with_later_ones():
+    chat = FakeChat(delay=0)
+    gateway = LLMGateway(chat)
+
+    async def twice():
+        await gateway.generate("same")
+        await gateway.generate("same")
+
+    run(twice())
+    assert chat.calls == 2
+
+
+def test_error_reaches_every_coalesced_waiter():
+    chat = FakeChat(errors=[StatusError(400)])
+    gateway = LLMGateway(chat)
+
+    async def ask():
+        return await asyncio.gather(*(gateway.generate("same") for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = run(ask())
+
+    assert chat.calls == 1
+    assert len(results) == 3
+    assert all(isinstance(r, StatusError) for r in results)
+    assert not gateway._inflight
+
+
+def test_generate_sql_many_reports_errors_per_question():
+    async def chat(prompt):
+        if "bad" in prompt:
+            raise StatusError(400)
+        return "SELECT 1"
+
+    results = run(LLMGateway(chat).generate_sql_many(["good", "bad"]))
+
+    assert results == [("good", "SELECT 1", None), ("bad", None, "HTTP 400")]
+
+
+# ============================= CONCURRENCY CAP =============================
+def test_concurrency_cap_limits_upstream_calls_in_flight():
+    chat = FakeChat(delay=0.05)
+    gateway = LLMGateway(chat, max_concurrency=2)
+
+    run(gateway.generate_sql_many([f"question {i}" for i in range(6)]))
+
+    assert chat.calls == 6
+    assert chat.peak == 2
+
+
+def test_concurrency_cap_must_be_positive():
+    with pytest.raises(ValueError):
+        LLMGateway(FakeChat(), max_concurrency=0)
+
+
+# ============================= TIMEOUT / RETRY =============================
+def test_each_attempt_is_bounded_by_timeout():
+    chat = FakeChat(delay=1.0)
+    gateway = LLMGateway(chat, timeout=0.05, max_retries=1, backoff_base=0)
+
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        run(gateway.generate("slow"))
+
+    assert time.perf_counter() - start < 0.5
+    assert chat.calls == 2
+    assert gateway.stats["retries"] == 1
+
+
+def test_transient_errors_retry_with_exponential_backoff(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def record_sleep(delay, *args, **kwargs):
+        if delay:   # FakeChat(delay=0) sleeps too; keep only the gateway's backoff
+            delays.append(delay)
+        await real_sleep(0)
+
+    chat = FakeChat(delay=0, errors=[StatusError(503), StatusError(429), ConnectionError()])
+    gateway = LLMGateway(chat, max_retries=3, backoff_base=0.5)
+    monkeypatch.setattr(llm_gateway.asyncio, "sleep", record_sleep)
+
+    assert run(gateway.generate("flaky")) == chat.reply
+    assert chat.calls == 4
+    assert gateway.stats["retries"] == 3
+    assert delays == [0.5, 1.0, 2.0]
+
+
+def test_retries_stop_after_max_retries():
+    chat = FakeChat(delay=0, errors=[StatusError(503)] * 10)
+    gateway = LLMGateway(chat, max_retries=2, backoff_base=0)
+
+    with pytest.raises(StatusError):
+        run(gateway.generate("down"))
+
+    assert chat.calls == 3
+
+
+def test_permanent_errors_are_not_retried():
+    chat = FakeChat(delay=0, errors=[StatusError(401)])
+    gateway = LLMGateway(chat, max_retries=2, backoff_base=1.0)
+
+    start = time.perf_counter()
+    with pytest.raises(StatusError):
+        run(gateway.generate("bad key"))
+
+    assert chat.calls == 1
+    assert gateway.stats["retries"] == 0
+    assert time.perf_counter() - start < 0.5
+
+
+def test_is_transient():
+    assert is_transient(asyncio.TimeoutError())
+    assert is_transient(ConnectionResetError())
+    assert is_transient(StatusError(429))
+    assert is_transient(StatusError(502))
+    assert not is_transient(StatusError(401))
+    assert not is_transient(StatusError(400))
+    assert not is_transient(RuntimeError("401 unauthorized"))
+
+
+# ============================= SYNC BRIDGE =============================
+def test_background_gateway_coalesces_across_threads():
+    chat = FakeChat(delay=0.1)
+    bg = BackgroundGateway(LLMGateway(chat))
+    try:
+        out = []
+        threads = [threading.Thread(target=lambda: out.append(bg.generate_sql("same")))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert out == [chat.reply] * 5
+        assert chat.calls == 1
+    finally:
+        bg.close()
+
+
+def test_background_gateway_timeout_cancels_coroutine():
+    bg = BackgroundGateway(LLMGateway(FakeChat()))
+    cancelled = threading.Event()
+
+    async def stuck():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        with pytest.raises(TimeoutError):
+            bg._run(stuck(), timeout=0.05)
+        assert cancelled.wait(1.0)
+    finally:
+        bg.close()
+
+
+def test_background_gateway_close_stops_loop_and_closes_client():
+    chat = FakeChat()
+    bg = BackgroundGateway(LLMGateway(chat))
+
+    bg.close()
+    bg.close()   # second call is a no-op
+
+    assert chat.closed
+    assert not bg._thread.is_alive()
+
+
+# ============================= END TO END =============================
+def test_cohere_chat_through_fake_server():
+    pytest.importorskip("cohere")
+
+    async def scenario():
+        async with FakeCohereServer(latency=0.05) as server:
+            gateway = LLMGateway(cohere_chat("fake-key", base_url=server.base_url))
+            try:
+                results = await gateway.generate_sql_many(["hostellers", "Hostellers", "year 2"])
+            finally:
+                await gateway.aclose()
+            return server.calls, results
+
+    calls, results = run(scenario())
+
+    assert calls == 2
+    assert [sql for _, sql, _ in results] == [CANNED_SQL] * 3
+
+
+def test_fake_server_failures_hit_gateway_retries_only():
+    pytest.importorskip("cohere")
+
+    async def scenario():
+        async with FakeCohereServer(latency=0, fail_rate=1.0) as server:
+            gateway = LLMGateway(cohere_chat("fake-key", base_url=server.base_url),
+                                 max_retries=2, backoff_base=0)
+            try:
+                results = await gateway.generate_sql_many(["anything"])
+            finally:
+                await gateway.aclose()
+            return server.calls, gateway.stats, results
+
+    calls, stats, results = run(scenario())
+
+    # SDK retries are off, so every 503 the server sends is one gateway attempt.
+    assert calls == 3
+    assert stats["retries"] == 2
+    assert results[0][2] is not None